@@ -34,6 +34,31 @@ SET
     END
 WHERE data_type IS NULL OR data IS NULL;
 
+-- Bulk image URL update used by the upload script
+CREATE OR REPLACE FUNCTION set_folder_images(updates JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE device_test AS t
+    SET images = ARRAY(SELECT jsonb_array_elements_text(u.images))
+    FROM jsonb_to_recordset(updates) AS u(folder_name TEXT, images JSONB)
+    WHERE t.folder_name = u.folder_name;
+    
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Per-folder row counts used by the upload script to find earlier inserts
+CREATE OR REPLACE FUNCTION get_folder_row_counts(folder_names TEXT[])
+RETURNS TABLE (folder_name TEXT, row_count BIGINT) AS $$
+    SELECT d.folder_name, COUNT(*)
+    FROM device_test d
+    WHERE d.folder_name = ANY(folder_names)
+    GROUP BY d.folder_name;
+$$ LANGUAGE sql STABLE;
+
 -- Verify the migration
 SELECT 
     COUNT(*) as total_records,
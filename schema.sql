@@ -184,6 +184,31 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Function to set the image URLs of many folders in one statement (used by the upload script)
+CREATE OR REPLACE FUNCTION set_folder_images(updates JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    updated_count INTEGER;
+BEGIN
+    UPDATE device_test AS t
+    SET images = ARRAY(SELECT jsonb_array_elements_text(u.images))
+    FROM jsonb_to_recordset(updates) AS u(folder_name TEXT, images JSONB)
+    WHERE t.folder_name = u.folder_name;
+    
+    GET DIAGNOSTICS updated_count = ROW_COUNT;
+    RETURN updated_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function to count the existing rows of many folders in one call (used by the upload script)
+CREATE OR REPLACE FUNCTION get_folder_row_counts(folder_names TEXT[])
+RETURNS TABLE (folder_name TEXT, row_count BIGINT) AS $$
+    SELECT d.folder_name, COUNT(*)
+    FROM device_test d
+    WHERE d.folder_name = ANY(folder_names)
+    GROUP BY d.folder_name;
+$$ LANGUAGE sql STABLE;
+
 -- ============================================================================
 -- 8. EXAMPLE QUERIES
 -- ============================================================================
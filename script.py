@@ -4,28 +4,113 @@ Supabase Upload Script
 Processes subfolders and uploads JSON files to device_test table and images to device_test bucket in Supabase
 """
 
+import argparse
+import asyncio
+import atexit
+import itertools
 import json
 import os
+import queue
+import random
 import sys
+import threading
 import time
 import logging
+import logging.handlers
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from pathlib import Path
-from typing import Dict, List, Tuple, Optional, Any
-from supabase import create_client, Client
-from supabase.lib.client_options import ClientOptions
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Coroutine, Dict, List, Optional, Set, Tuple
+from urllib.parse import quote
+import httpx
+from postgrest import SyncRequestBuilder
+from supabase import acreate_client, create_client, AsyncClient, Client
+from supabase.lib.client_options import AsyncClientOptions, ClientOptions
 
-# Configure logging
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; fall back to the standard library json module
+    orjson = None
+
+# Configure logging; worker threads only enqueue records and a single listener thread
+# writes them to the log file and console, so no thread blocks on log I/O
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue,
+    logging.FileHandler('upload_log.txt'),
+    logging.StreamHandler()
+)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('upload_log.txt'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
 logger = logging.getLogger(__name__)
 
+# First retry waits about this many seconds, doubling after each failed attempt
+RETRY_BASE_DELAY = 0.4
+
+# Default number of concurrent image uploads per folder (overridden by IMG_CONCURRENCY)
+DEFAULT_MAX_CONNECTIONS = 8
+
+# Default number of subfolders processed concurrently (overridden by UPLOAD_WORKERS)
+DEFAULT_FOLDER_WORKERS = 4
+
+# Large JSON arrays are inserted in chunks of this many rows, several chunks at a time
+INSERT_CHUNK_SIZE = 500
+INSERT_WORKERS = 4
+
+# Small folders wait this long for other folders to join the same insert request
+BATCH_LINGER_SECONDS = 0.25
+
+# Folders read and parsed ahead of the upload workers, per worker
+PREPARE_AHEAD = 1
+
+# classify_folder result: (data JSON filenames, (image filename, extension, size) tuples,
+# result files from previous runs)
+FolderContents = Tuple[List[str], List[Tuple[str, str, int]], Set[str]]
+
+# Number of folder names checked per existing-rows lookup query
+EXISTING_LOOKUP_PAGE_SIZE = 1000
+
+# Images are streamed to storage in chunks of this size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Number of objects requested per bucket listing page when resuming a folder
+BUCKET_LIST_PAGE_SIZE = 1000
+
+# Seconds allowed per storage request, the same as the SDK's storage client
+STORAGE_TIMEOUT = 20
+
+# Maximum size of the data preview stored in result files
+DATA_PREVIEW_LENGTH = 200
+
+# Destination table for the JSON records and bucket for the images
+TABLE_NAME = "device_test"
+BUCKET_NAME = "devicetest"
+
+# Content types of the supported image extensions; fixed rather than read from the
+# system mimetypes registry, which differs between hosts (e.g. image/x-ms-bmp)
+_CONTENT_TYPES: Dict[str, str] = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'bmp': 'image/bmp',
+    'tiff': 'image/tiff',
+    'webp': 'image/webp'
+}
+_IMAGE_EXTENSIONS = frozenset(_CONTENT_TYPES)
+
+# Files the script writes into processed folders; never treated as data JSON
+_RESULT_FILENAMES = frozenset({'upload_success.json', 'upload_failed.json'})
+
+# Event loop on a background thread that runs every image upload, started on first use
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+_async_loop_lock = threading.Lock()
+
 class UploadError(Exception):
     """Custom exception for upload-related errors"""
     pass
@@ -42,30 +127,54 @@ def validate_environment() -> None:
         logger.info("✓ Supabase client library available")
     except ImportError as e:
         error_msg = f"Missing required dependency: {e}"
-        print(f"ERROR: {error_msg}")
         raise UploadError(error_msg)
 
 def validate_supabase_connection(supabase: Client) -> bool:
     """Validate Supabase connection"""
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # Test connection by making a simple query
-            response = supabase.table("device_test").select("count", count="exact").limit(1).execute()
-            logger.info("✓ Supabase connection validated")
-            return True
-        except Exception as e:
-            error_msg = f"Connection attempt {attempt + 1}/{max_retries} failed: {e}"
-            logger.warning(error_msg)
-            print(f"WARNING: {error_msg}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)  # Exponential backoff
-            else:
-                final_error = "Failed to establish Supabase connection after all retries"
-                logger.error(final_error)
-                print(f"ERROR: {final_error}")
-                return False
-    return False
+    try:
+        # Test connection by fetching at most one id; an exact count would scan the whole table
+        _with_retry(
+            lambda: supabase.table(TABLE_NAME).select("id").limit(1).execute(),
+            label="Connection"
+        )
+        logger.info("✓ Supabase connection validated")
+        return True
+    except Exception:
+        final_error = "Failed to establish Supabase connection after all retries"
+        logger.error(final_error)
+        return False
+
+def configure_connection_pool(supabase: Client, pool_size: int) -> None:
+    """Rebuild the client's REST HTTP session with a larger keep-alive pool"""
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    
+    # Passing limits rather than a transport keeps httpx's own transport setup, so proxy
+    # environment variables still apply; the SDK builds its session with the default
+    # verify and proxy settings, which the new session gets as well
+    session = supabase.postgrest.session
+    supabase.postgrest.session = httpx.Client(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=session.timeout,
+        follow_redirects=True,
+        trust_env=session.trust_env,
+        http2=True,
+        limits=limits
+    )
+    session.close()
+    
+    logger.info(f"✓ HTTP connection pool configured ({pool_size} keep-alive connections)")
+
+def create_storage_session(url: str, key: str, pool_size: int) -> httpx.AsyncClient:
+    """Create the HTTP session that streams image uploads to the storage API"""
+    return httpx.AsyncClient(
+        base_url=f"{url}/storage/v1/",
+        headers={"apikey": key, "Authorization": f"Bearer {key}"},
+        timeout=STORAGE_TIMEOUT,
+        follow_redirects=True,
+        http2=True,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    )
 
 def validate_json_structure(data: Any, filename: str) -> None:
     """Validate JSON data structure"""
@@ -89,6 +198,60 @@ def validate_json_structure(data: Any, filename: str) -> None:
         if not any(record.get(field) for field in identifiers):
             logger.warning(f"Record {i} in {filename} lacks identifying fields: {identifiers}")
 
+def json_dumps_pretty(data: Any) -> bytes:
+    """Serialize data as indented UTF-8 JSON, using orjson when available"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the json module writes exactly
+            pass
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+def build_data_preview(json_data: Any, limit: int = DATA_PREVIEW_LENGTH) -> Any:
+    """Return json_data itself if it serializes within limit bytes, otherwise a truncated JSON string"""
+    if not json_data:
+        return json_data
+    
+    # Only the first `limit` list items or object keys can appear in the preview, so skip
+    # serializing the rest
+    truncated = isinstance(json_data, (list, dict)) and len(json_data) > limit
+    if not truncated:
+        sample = json_data
+    elif isinstance(json_data, dict):
+        sample = dict(itertools.islice(json_data.items(), limit))
+    else:
+        sample = list(itertools.islice(json_data, limit))
+    
+    serialized = None
+    if orjson is not None:
+        try:
+            serialized = orjson.dumps(sample, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # orjson rejects nesting deeper than it can parse and integers beyond 64 bits
+            pass
+    
+    if serialized is None:
+        try:
+            serialized = json.dumps(sample, ensure_ascii=False).encode('utf-8')
+        except (TypeError, ValueError, RecursionError) as e:
+            # The preview is informational only, so describe the data instead
+            return f"<{type(json_data).__name__} not previewable: {e}>"
+    
+    if not truncated and len(serialized) <= limit:
+        return json_data
+    
+    return serialized[:limit].decode('utf-8', 'ignore') + "..."
+
+def load_json_file(file_path: str) -> Any:
+    """Read and parse a JSON file
+    
+    Parsed with the json module rather than orjson, which turns integers wider than
+    64 bits (e.g. numeric ICCIDs) into floats instead of keeping them exact.
+    """
+    with open(file_path, 'rb') as f:
+        return json.loads(f.read())
+
 def get_subfolders_to_process(parent_folder: str) -> List[Tuple[str, str]]:
     """Get subfolders to process with comprehensive error handling"""
     try:
@@ -101,40 +264,41 @@ def get_subfolders_to_process(parent_folder: str) -> List[Tuple[str, str]]:
         if not os.access(parent_folder, os.R_OK):
             raise UploadError(f"No read permission for '{parent_folder}'")
         
-        # Get all subdirectories
+        # Get all subdirectories; scandir entries cache their type and stat results
         subfolders = []
         
         try:
-            items = os.listdir(parent_folder)
+            entries = os.scandir(parent_folder)
         except PermissionError:
             raise UploadError(f"Permission denied accessing '{parent_folder}'")
         except OSError as e:
             raise UploadError(f"OS error accessing '{parent_folder}': {e}")
         
-        for item in items:
-            try:
-                item_path = os.path.join(parent_folder, item)
-                if not os.path.isdir(item_path):
-                    continue
-                
-                # Check if already processed (has upload_success.json)
-                success_file = os.path.join(item_path, "upload_success.json")
-                if os.path.exists(success_file):
-                    logger.info(f"⏭️  Skipping {item} - already processed (upload_success.json found)")
-                    continue
-                
-                # Get modification time with error handling
+        with entries:
+            for entry in entries:
+                item = entry.name
                 try:
-                    mod_time = os.path.getmtime(item_path)
-                    subfolders.append((item_path, mod_time, item))
-                except OSError as e:
-                    logger.warning(f"Could not get modification time for {item}: {e}")
-                    # Use current time as fallback
-                    subfolders.append((item_path, time.time(), item))
+                    if not entry.is_dir():
+                        continue
                     
-            except Exception as e:
-                logger.warning(f"Error processing item '{item}': {e}")
-                continue
+                    # Check if already processed (has upload_success.json); the folder's
+                    # files are only listed later, when it is prepared for upload
+                    if os.path.exists(os.path.join(entry.path, "upload_success.json")):
+                        logger.info(f"⏭️  Skipping {item} - already processed (upload_success.json found)")
+                        continue
+                    
+                    # Get modification time with error handling
+                    try:
+                        mod_time = entry.stat().st_mtime
+                        subfolders.append((entry.path, mod_time, item))
+                    except OSError as e:
+                        logger.warning(f"Could not get modification time for {item}: {e}")
+                        # Use current time as fallback
+                        subfolders.append((entry.path, time.time(), item))
+                        
+                except Exception as e:
+                    logger.warning(f"Error processing item '{item}': {e}")
+                    continue
         
         # Sort by modification time (latest first)
         subfolders.sort(key=lambda x: x[1], reverse=True)
@@ -147,117 +311,307 @@ def get_subfolders_to_process(parent_folder: str) -> List[Tuple[str, str]]:
         raise
     except Exception as e:
         error_msg = f"Unexpected error getting subfolders: {e}"
-        print(f"ERROR: {error_msg}")
         raise UploadError(error_msg)
 
-def get_image_files(folder_path: str) -> List[str]:
-    """Get all image files from the folder with error handling"""
+def classify_folder(folder_path: str) -> FolderContents:
+    """Scan a folder once and classify its entries
+    
+    Returns (data JSON filenames, (image filename, lowercase extension, size in bytes) tuples,
+    result files present from previous runs).
+    """
+    json_files = []
+    image_files = []
+    result_files = set()
+    
     try:
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-        image_files = []
-        
-        if not os.access(folder_path, os.R_OK):
-            logger.warning(f"No read permission for folder: {folder_path}")
-            return []
-        
-        try:
-            files = os.listdir(folder_path)
-        except PermissionError:
-            error_msg = f"Permission denied accessing folder: {folder_path}"
-            logger.error(error_msg)
-            print(f"ERROR: {error_msg}")
-            return []
-        except OSError as e:
-            error_msg = f"OS error accessing folder {folder_path}: {e}"
-            logger.error(error_msg)
-            print(f"ERROR: {error_msg}")
-            return []
-        
-        for filename in files:
+        entries = os.scandir(folder_path)
+    except PermissionError:
+        raise UploadError(f"Permission denied accessing folder: {folder_path}")
+    except OSError as e:
+        raise UploadError(f"Cannot read folder contents of {folder_path}: {e}")
+    
+    with entries:
+        for entry in entries:
+            filename = entry.name
+            
+            if filename in _RESULT_FILENAMES:
+                result_files.add(filename)
+                continue
+            
+            # Check the extension before touching the filesystem
+            extension = get_file_extension(filename)
+            if extension == 'json':
+                json_files.append(filename)
+                continue
+            if extension not in _IMAGE_EXTENSIONS:
+                continue
+            
             try:
-                file_path = os.path.join(folder_path, filename)
-                if os.path.isfile(file_path) and Path(filename).suffix.lower() in image_extensions:
-                    # Validate file is readable and not corrupted
-                    if os.access(file_path, os.R_OK) and os.path.getsize(file_path) > 0:
-                        image_files.append(filename)
-                    else:
-                        logger.warning(f"Skipping unreadable or empty image: {filename}")
-            except Exception as e:
+                # Validate image is a readable, non-empty file; the size is kept for the upload
+                if not entry.is_file():
+                    continue
+                file_size = entry.stat().st_size
+                if file_size > 0 and os.access(entry.path, os.R_OK):
+                    image_files.append((filename, extension, file_size))
+                else:
+                    logger.warning(f"Skipping unreadable or empty image: {filename}")
+            except OSError as e:
                 logger.warning(f"Error processing image file {filename}: {e}")
-                continue
-        
-        return image_files
-        
-    except Exception as e:
-        error_msg = f"Unexpected error getting image files from {folder_path}: {e}"
-        logger.error(error_msg)
-        print(f"ERROR: {error_msg}")
-        return []
+    
+    return json_files, image_files, result_files
+
+def is_fatal_error(error: Exception) -> bool:
+    """Return True for errors a retry cannot fix, such as 4xx responses and constraint violations"""
+    # httpx errors carry the response; storage3's StorageApiError carries a status string
+    status = getattr(getattr(error, 'response', None), 'status_code', None) or getattr(error, 'status', None)
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+    
+    if status is not None:
+        # Timeouts and rate limits are worth another attempt
+        return 400 <= status < 500 and status not in (408, 429)
+    
+    # postgrest's APIError carries a Postgres SQLSTATE or a PostgREST error code: data,
+    # constraint and schema errors and PostgREST request, schema and auth errors are permanent
+    code = getattr(error, 'code', None)
+    if isinstance(code, str):
+        return code.startswith(('22', '23', '42', 'PGRST1', 'PGRST2', 'PGRST3'))
+    
+    return False
 
-def upload_image_with_retry(supabase: Client, file_path: str, storage_path: str, 
-                          bucket_name: str, max_retries: int = 3) -> Tuple[bool, str, str]:
-    """Upload a single image with retry logic"""
-    for attempt in range(max_retries):
+def retry_delay(attempt: int) -> float:
+    """Seconds to wait before retry number attempt + 1, with +/-25% jitter"""
+    return RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.75, 1.25)
+
+def _with_retry(fn: Callable[..., Any], *args: Any, attempts: int = 3,
+                label: str = "Operation", **kwargs: Any) -> Any:
+    """Call fn with jittered exponential backoff between attempts, re-raising the last or a fatal error"""
+    for attempt in range(attempts):
         try:
-            # Validate file exists and is readable
-            if not os.path.exists(file_path):
-                return False, f"File not found: {file_path}", ""
-            
-            if not os.access(file_path, os.R_OK):
-                return False, f"No read permission for file: {file_path}", ""
-            
-            file_size = os.path.getsize(file_path)
-            if file_size == 0:
-                return False, f"File is empty: {file_path}", ""
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logger.warning(f"{label} attempt {attempt + 1}/{attempts} failed: {e}")
             
-            if file_size > 50 * 1024 * 1024:  # 50MB limit
-                return False, f"File too large ({file_size} bytes): {file_path}", ""
+            if attempt == attempts - 1 or is_fatal_error(e):
+                raise
             
-            # Read file with error handling
-            try:
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
-            except IOError as e:
-                return False, f"Error reading file {file_path}: {e}", ""
+            wait_time = retry_delay(attempt)
+            logger.info(f"Retrying {label.lower()} in {wait_time:.1f} seconds...")
+            time.sleep(wait_time)
+
+async def _with_retry_async(fn: Callable[..., Awaitable[Any]], *args: Any, attempts: int = 3,
+                            label: str = "Operation", **kwargs: Any) -> Any:
+    """Await fn with jittered exponential backoff between attempts, re-raising the last or a fatal error"""
+    for attempt in range(attempts):
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            logger.warning(f"{label} attempt {attempt + 1}/{attempts} failed: {e}")
             
-            # Determine content type
-            extension = Path(file_path).suffix[1:].lower()
-            content_type = f"image/{extension}"
-            if extension == 'jpg':
-                content_type = "image/jpeg"
+            if attempt == attempts - 1 or is_fatal_error(e):
+                raise
             
-            # Upload to bucket with timeout
-            response = supabase.storage.from_(bucket_name).upload(
-                path=storage_path,
-                file=file_data,
-                file_options={"content-type": content_type}
+            wait_time = retry_delay(attempt)
+            logger.info(f"Retrying {label.lower()} in {wait_time:.1f} seconds...")
+            await asyncio.sleep(wait_time)
+
+def get_async_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop used for async uploads, starting it on first use"""
+    global _async_loop
+    with _async_loop_lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-upload", daemon=True).start()
+            _async_loop = loop
+    return _async_loop
+
+def run_async(coro: Coroutine[Any, Any, Any]) -> Future:
+    """Schedule a coroutine on the background event loop and return a thread-safe future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_async_loop())
+
+def get_file_extension(filename: str) -> str:
+    """Return the lowercase extension of a filename, or '' for names like 'json' or '.jpg'"""
+    base, dot, extension = filename.rpartition('.')
+    return extension.lower() if dot and base else ''
+
+def get_content_type(extension: str) -> str:
+    """Return the MIME type for a lowercase file extension (e.g. 'jpg' -> 'image/jpeg')"""
+    return _CONTENT_TYPES.get(extension, "application/octet-stream")
+
+async def get_public_url(bucket: Any, storage_path: str,
+                         public_url_base: Optional[str] = None) -> str:
+    """Return the public URL of a stored object, built locally when public_url_base is given"""
+    if public_url_base:
+        return f"{public_url_base}/{quote(storage_path)}"
+    return await bucket.get_public_url(storage_path)
+
+async def get_stored_images(bucket: Any, folder_path: str, folder_name: str,
+                            page_size: int = BUCKET_LIST_PAGE_SIZE) -> Dict[str, Optional[int]]:
+    """Return {filename: size in bytes or None} for images already stored under folder_name
+    
+    Lists the bucket prefix; if that fails, falls back to the uploaded images recorded in the
+    folder's upload_failed.json from the previous run.
+    """
+    stored = {}
+    
+    try:
+        offset = 0
+        while True:
+            page = await _with_retry_async(
+                bucket.list, folder_name, {"limit": page_size, "offset": offset},
+                label="Bucket listing"
             )
+            for obj in page:
+                stored[obj["name"]] = (obj.get("metadata") or {}).get("size")
             
-            # Get public URL
-            public_url = supabase.storage.from_(bucket_name).get_public_url(storage_path)
+            if len(page) < page_size:
+                return stored
+            offset += page_size
             
-            if not public_url:
-                return False, "Failed to get public URL", ""
-            
-            return True, "", public_url
+    except Exception as e:
+        logger.warning(f"Could not list bucket folder '{folder_name}', using previous result file: {e}")
+    
+    try:
+        with open(os.path.join(folder_path, "upload_failed.json"), 'rb') as f:
+            previous = json.loads(f.read())
+        return {
+            image["filename"]: image.get("size_bytes")
+            for image in previous.get("image_upload", {}).get("uploaded_images", [])
+        }
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f"Could not read previous results for '{folder_name}': {e}")
+        return {}
+
+async def read_file_chunks(f: BinaryIO, file_size: int,
+                           chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield the first file_size bytes of an open file in chunks, reading off the event loop thread
+    
+    Stopping at the known size saves the extra read that would only report end of file, which
+    for images smaller than one chunk halves the thread hand-offs.
+    """
+    f.seek(0)
+    remaining = file_size
+    while remaining > 0:
+        chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+async def warm_up_storage(storage_session: httpx.AsyncClient, bucket_id: str) -> None:
+    """Open a storage connection ahead of time so the first image upload skips the TLS handshake"""
+    try:
+        await storage_session.get(f"bucket/{bucket_id}")
+        logger.info("✓ Storage connection warmed up")
+    except Exception as e:
+        # Only the connection matters here; an error response still leaves it open
+        logger.debug(f"Storage warm-up request failed: {e}")
+
+async def upload_image_with_retry(bucket: Any, storage_session: httpx.AsyncClient,
+                                file_path: str, storage_path: str,
+                                max_retries: int = 3,
+                                extension: Optional[str] = None,
+                                public_url_base: Optional[str] = None,
+                                upsert: bool = False,
+                                file_size: Optional[int] = None) -> Tuple[bool, str, str]:
+    """Upload a single image with retry logic
+    
+    When public_url_base is given the public URL is built locally instead of through the SDK.
+    Set upsert to overwrite an object that already exists at storage_path. A file_size from
+    classify_folder is checked against the opened file, so a file that changed since the scan
+    fails instead of being uploaded cut short.
+    """
+    if file_size is None:
+        # Validate file exists and is readable
+        if not os.path.exists(file_path):
+            return False, f"File not found: {file_path}", ""
+        
+        if not os.access(file_path, os.R_OK):
+            return False, f"No read permission for file: {file_path}", ""
+    
+    try:
+        f = open(file_path, 'rb')
+    except OSError as e:
+        return False, f"Cannot open file {file_path}: {e}", ""
+    
+    with f:
+        # Size the upload from the open handle, which is what is actually streamed
+        actual_size = os.fstat(f.fileno()).st_size
+        
+        if file_size is not None and actual_size != file_size:
+            return False, f"File changed since scan ({file_size} -> {actual_size} bytes): {file_path}", ""
+        
+        file_size = actual_size
+        
+        if file_size == 0:
+            return False, f"File is empty: {file_path}", ""
+        
+        if file_size > 50 * 1024 * 1024:  # 50MB limit
+            return False, f"File too large ({file_size} bytes): {file_path}", ""
+        
+        # Determine content type
+        if extension is None:
+            extension = get_file_extension(os.path.basename(file_path))
+        content_type = get_content_type(extension)
+        
+        async def _upload_stream() -> Any:
+            headers = {
+                "content-type": content_type,
+                "content-length": str(file_size),
+                "cache-control": "max-age=3600",
+                "x-upsert": "true" if upsert else "false"
+            }
             
+            # POST the raw file to the storage object endpoint, streamed in chunks
+            # instead of read into memory or wrapped in a multipart form
+            response = await storage_session.post(
+                f"object/{bucket.id}/{quote(storage_path)}",
+                content=read_file_chunks(f, file_size),
+                headers=headers
+            )
+            if response.is_error:
+                raise httpx.HTTPStatusError(
+                    f"Storage returned HTTP {response.status_code}: {response.text}",
+                    request=response.request,
+                    response=response
+                )
+            return response
+        
+        try:
+            # Only the network call is retried; the checks above run once and each attempt
+            # streams the already open file again from the start
+            await _with_retry_async(_upload_stream, attempts=max_retries, label="Upload")
         except Exception as e:
-            error_msg = f"Upload attempt {attempt + 1}/{max_retries} failed: {e}"
-            logger.warning(error_msg)
-            
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logger.info(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                return False, f"All upload attempts failed. Last error: {e}", ""
+            return False, f"All upload attempts failed. Last error: {e}", ""
+        
+        # A file still being written may have grown while it was streamed
+        if os.fstat(f.fileno()).st_size != file_size:
+            return False, f"File changed during upload: {file_path}", ""
     
-    return False, "Max retries exceeded", ""
+    try:
+        # Get public URL
+        public_url = await get_public_url(bucket, storage_path, public_url_base)
+    except Exception as e:
+        return False, f"Failed to get public URL: {e}", ""
+    
+    if not public_url:
+        return False, "Failed to get public URL", ""
+    
+    return True, "", public_url
 
-def upload_images_to_bucket(supabase: Client, folder_path: str, folder_name: str, 
-                          image_files: List[str]) -> Tuple[List[Dict], List[Dict], List[str]]:
-    """Upload images to Supabase storage bucket with comprehensive error handling"""
-    bucket_name = "devicetest"
+async def upload_images_to_bucket(bucket: Any, storage_session: httpx.AsyncClient,
+                                  folder_path: str, folder_name: str,
+                                  image_files: List[Tuple[str, str, int]], 
+                                  max_concurrency: int = DEFAULT_MAX_CONNECTIONS,
+                                  public_url_base: Optional[str] = None,
+                                  resume: bool = False) -> Tuple[List[Dict], List[Dict], List[str]]:
+    """Upload images to Supabase storage bucket concurrently with comprehensive error handling
+    
+    Runs on the background event loop; at most max_concurrency uploads are in flight at once.
+    With resume set, images already in the bucket with the same size are not uploaded again.
+    """
     uploaded_images = []
     failed_images = []
     image_urls = []
@@ -266,21 +620,35 @@ def upload_images_to_bucket(supabase: Client, folder_path: str, folder_name: str
         logger.info("No image files to upload")
         return uploaded_images, failed_images, image_urls
     
-    logger.info(f"Uploading {len(image_files)} images to bucket '{bucket_name}'")
+    logger.info(f"Uploading {len(image_files)} images to bucket '{bucket.id}' "
+                f"({min(max_concurrency, len(image_files))} concurrent upload(s))")
     
-    for i, image_file in enumerate(image_files, 1):
+    # On a rerun, find the images that already reached the bucket
+    stored_images = await get_stored_images(bucket, folder_path, folder_name) if resume else {}
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def _upload_one(image_file: str, extension: str, file_size: int) -> None:
+        """Upload one image and record the outcome"""
+        file_path = os.path.join(folder_path, image_file)
+        storage_path = f"{folder_name}/{image_file}"
+        
         try:
-            logger.info(f"Uploading image {i}/{len(image_files)}: {image_file}")
-            
-            file_path = os.path.join(folder_path, image_file)
-            storage_path = f"{folder_name}/{image_file}"
-            
-            success, error_msg, public_url = upload_image_with_retry(
-                supabase, file_path, storage_path, bucket_name
-            )
+            if image_file in stored_images and stored_images[image_file] in (None, file_size):
+                success, error_msg = True, ""
+                public_url = await get_public_url(bucket, storage_path, public_url_base)
+                logger.info(f"    ⏭️  Already in bucket: {image_file}")
+            else:
+                async with semaphore:
+                    success, error_msg, public_url = await upload_image_with_retry(
+                        bucket, storage_session, file_path, storage_path,
+                        extension=extension, public_url_base=public_url_base,
+                        upsert=image_file in stored_images, file_size=file_size
+                    )
+                if success:
+                    logger.info(f"    ✓ Uploaded: {image_file} -> {public_url}")
             
             if success:
-                file_size = os.path.getsize(file_path)
                 uploaded_images.append({
                     "filename": image_file,
                     "storage_path": storage_path,
@@ -288,14 +656,13 @@ def upload_images_to_bucket(supabase: Client, folder_path: str, folder_name: str
                     "size_bytes": file_size
                 })
                 image_urls.append(public_url)
-                logger.info(f"    ✓ Uploaded: {image_file} -> {public_url}")
             else:
                 failed_images.append({
                     "filename": image_file,
                     "error": error_msg
                 })
                 logger.error(f"    ✗ Failed: {image_file} - {error_msg}")
-            
+                
         except Exception as e:
             error_msg = f"Unexpected error uploading {image_file}: {e}"
             failed_images.append({
@@ -303,7 +670,12 @@ def upload_images_to_bucket(supabase: Client, folder_path: str, folder_name: str
                 "error": error_msg
             })
             logger.error(f"    ✗ {error_msg}")
-            print(f"ERROR: {error_msg}")
+    
+    # Outcomes are recorded by _upload_one; return_exceptions keeps one crashed upload from cancelling the rest
+    await asyncio.gather(
+        *(_upload_one(image_file, extension, file_size) for image_file, extension, file_size in image_files),
+        return_exceptions=True
+    )
     
     success_count = len(uploaded_images)
     total_count = len(image_files)
@@ -311,30 +683,179 @@ def upload_images_to_bucket(supabase: Client, folder_path: str, folder_name: str
     
     return uploaded_images, failed_images, image_urls
 
-def insert_data_with_retry(supabase: Client, table_name: str, records: List[Dict], 
-                         max_retries: int = 3) -> Tuple[bool, str, int]:
-    """Insert data to database with retry logic"""
-    for attempt in range(max_retries):
-        try:
-            response = supabase.table(table_name).insert(records).execute()
+def _insert_chunk_with_retry(table: SyncRequestBuilder, records: List[Dict], 
+                             max_retries: int = 3, upsert: bool = False) -> Tuple[bool, str, int]:
+    """Insert one chunk of records with retry logic
+    
+    With upsert set, rows that already exist for the same folder_name and device_id are
+    updated instead of rejected by the unique constraint.
+    """
+    def _write() -> Any:
+        if upsert:
+            return table.upsert(records, on_conflict="folder_name,device_id").execute()
+        return table.insert(records).execute()
+    
+    try:
+        response = _with_retry(
+            _write,
+            attempts=max_retries,
+            label="Database insert"
+        )
+    except Exception as e:
+        return False, f"All database insert attempts failed. Last error: {e}", 0
+    
+    if hasattr(response, 'data') and response.data:
+        return True, "", len(response.data)
+    
+    return False, "No data returned from insert operation", 0
+
+def insert_data_with_retry(table: SyncRequestBuilder, records: List[Dict], 
+                         max_retries: int = 3, upsert: bool = False) -> Tuple[bool, str, int]:
+    """Insert data to database in parallel chunks with retry logic"""
+    chunks = [records[i:i + INSERT_CHUNK_SIZE] for i in range(0, len(records), INSERT_CHUNK_SIZE)]
+    
+    if len(chunks) <= 1:
+        return _insert_chunk_with_retry(table, records, max_retries, upsert)
+    
+    logger.info(f"    Inserting {len(records)} records in {len(chunks)} chunks of up to {INSERT_CHUNK_SIZE}")
+    
+    with ThreadPoolExecutor(max_workers=INSERT_WORKERS) as executor:
+        results = list(executor.map(
+            lambda chunk: _insert_chunk_with_retry(table, chunk, max_retries, upsert), chunks
+        ))
+    
+    inserted_count = sum(count for _, _, count in results)
+    errors = [error_msg for success, error_msg, _ in results if not success]
+    
+    if errors:
+        return False, f"{len(errors)}/{len(chunks)} chunk(s) failed ({inserted_count} rows inserted). First error: {errors[0]}", inserted_count
+    
+    return True, "", inserted_count
+
+class BatchWriter:
+    """Combine rows submitted by concurrent folders into one write request
+    
+    A batch is written once it holds max_rows rows or linger seconds after its first
+    submission. If a combined batch fails, each submission is retried on its own so
+    one folder's bad rows do not fail the other folders in the batch.
+    """
+    
+    def __init__(self, write_batch: Callable[[List[Dict]], Tuple[bool, str, int]],
+                 max_rows: int = INSERT_CHUNK_SIZE, linger: float = BATCH_LINGER_SECONDS):
+        self._write_batch = write_batch
+        self._max_rows = max_rows
+        self._linger = linger
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[List[Dict], Future]] = []
+        self._pending_rows = 0
+        self._timer: Optional[threading.Timer] = None
+    
+    def submit(self, rows: List[Dict]) -> Future:
+        """Queue rows for the next batch; the future resolves to (success, error_msg, row_count)"""
+        future = Future()
+        
+        with self._lock:
+            self._pending.append((rows, future))
+            self._pending_rows += len(rows)
             
-            if hasattr(response, 'data') and response.data:
-                return True, "", len(response.data)
+            if self._pending_rows >= self._max_rows:
+                batch = self._take_pending()
             else:
-                return False, "No data returned from insert operation", 0
-                
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self._linger, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        
+        if batch:
+            self._write(batch)
+        
+        return future
+    
+    def flush(self) -> None:
+        """Write whatever is pending now"""
+        with self._lock:
+            batch = self._take_pending()
+        
+        if batch:
+            self._write(batch)
+    
+    def _take_pending(self) -> List[Tuple[List[Dict], Future]]:
+        """Detach the pending submissions; the caller must hold the lock"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch = self._pending
+        self._pending = []
+        self._pending_rows = 0
+        return batch
+    
+    def _write_rows(self, rows: List[Dict]) -> Tuple[bool, str]:
+        """Write one request, turning unexpected exceptions into a failed result"""
+        try:
+            success, error_msg, _ = self._write_batch(rows)
         except Exception as e:
-            error_msg = f"Database insert attempt {attempt + 1}/{max_retries} failed: {e}"
-            logger.warning(error_msg)
+            success, error_msg = False, str(e)
+        return success, error_msg
+    
+    def _write(self, batch: List[Tuple[List[Dict], Future]]) -> None:
+        """Write a batch and resolve the future of every submission in it"""
+        success, error_msg = self._write_rows([row for rows, _ in batch for row in rows])
+        
+        if success or len(batch) == 1:
+            for rows, future in batch:
+                future.set_result((success, error_msg, len(rows) if success else 0))
+            return
+        
+        logger.warning(f"Combined write of {len(batch)} folders failed, retrying each on its own: {error_msg}")
+        for rows, future in batch:
+            success, error_msg = self._write_rows(rows)
+            future.set_result((success, error_msg, len(rows) if success else 0))
+
+def get_existing_row_counts(supabase: Client, table: SyncRequestBuilder, folder_names: List[str],
+                            page_size: int = EXISTING_LOOKUP_PAGE_SIZE) -> Dict[str, int]:
+    """Return {folder_name: row count} for the folder_names that already have rows in the table
+    
+    Uses the get_folder_row_counts function (one row per folder, so PostgREST's max-rows cap
+    cannot cut a page short); databases without it page through the matching rows instead.
+    """
+    counts: Dict[str, int] = {}
+    
+    try:
+        for i in range(0, len(folder_names), page_size):
+            page = folder_names[i:i + page_size]
+            response = _with_retry(
+                lambda: supabase.rpc('get_folder_row_counts', {'folder_names': page}).execute(),
+                label="Existing row count"
+            )
+            counts.update((row['folder_name'], row['row_count']) for row in response.data or [])
+        return counts
+    except Exception as e:
+        if getattr(e, 'code', None) != 'PGRST202':
+            raise
+        logger.warning("get_folder_row_counts is not in the database (run migration.sql) - counting from the rows")
+    
+    for i in range(0, len(folder_names), page_size):
+        page = folder_names[i:i + page_size]
+        offset = 0
+        
+        # Explicit ranges of page_size rows stay within PostgREST's max-rows cap
+        while True:
+            response = _with_retry(
+                lambda: table.select('folder_name').in_('folder_name', page)
+                             .order('id').range(offset, offset + page_size - 1).execute(),
+                label="Existing row count"
+            )
+            rows = response.data or []
+            for row in rows:
+                counts[row['folder_name']] = counts.get(row['folder_name'], 0) + 1
             
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logger.info(f"Retrying database insert in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                return False, f"All database insert attempts failed. Last error: {e}", 0
+            if len(rows) < page_size:
+                break
+            offset += page_size
     
-    return False, "Max retries exceeded", 0
+    return counts
 
 def write_result_file(folder_path: str, filename: str, data: Dict) -> bool:
     """Write result data to JSON file with error handling"""
@@ -344,63 +865,153 @@ def write_result_file(folder_path: str, filename: str, data: Dict) -> bool:
             return False
         
         result_file_path = os.path.join(folder_path, filename)
+        temp_path = f"{result_file_path}.tmp"
         
-        # Create backup if file exists
-        if os.path.exists(result_file_path):
-            backup_path = f"{result_file_path}.backup"
-            try:
-                os.rename(result_file_path, backup_path)
-                logger.info(f"Created backup: {backup_path}")
-            except OSError as e:
-                logger.warning(f"Could not create backup: {e}")
-        
-        # Write new file
-        with open(result_file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        
-        # Validate written file
+        # Write the new file to a temporary path first, so a crash mid-write never
+        # leaves a partial upload_success.json that would mark the folder as processed
         try:
-            with open(result_file_path, 'r', encoding='utf-8') as f:
-                json.load(f)
-            logger.info(f"    ✓ Result file written and validated: {result_file_path}")
-            return True
-        except json.JSONDecodeError:
-            logger.error(f"Written file is not valid JSON: {result_file_path}")
-            return False
+            with open(temp_path, 'wb') as f:
+                f.write(json_dumps_pretty(data))
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        # Atomically replace any previous result file with the complete new one; the bytes
+        # came straight from the serializer, so there is no need to read them back to validate
+        os.replace(temp_path, result_file_path)
+        logger.info(f"    ✓ Result file written: {result_file_path}")
+        return True
             
     except Exception as e:
         error_msg = f"Failed to write result file {filename}: {e}"
         logger.error(f"    ✗ {error_msg}")
-        print(f"ERROR: {error_msg}")
         return False
 
-def process_single_folder(supabase: Client, folder_path: str, folder_name: str, 
-                         table_name: str) -> bool:
-    """Process a single folder with comprehensive error handling"""
-    logger.info(f"\n📁 Processing folder: {folder_name}")
+def _to_db_record(item: Dict, folder_name: str) -> Dict:
+    """Map one JSON object to a device_test row"""
+    return {
+        'folder_name': folder_name,
+        'data_type': item.get('data_type', 'device_test'),
+        'data': item,
+        'device_id': item.get('device_id'),
+        'device_name': item.get('device_name'),
+        'device_type': item.get('device_type'),
+        'test_results': item.get('test_results'),
+        'test_date': item.get('test_date'),
+        'test_status': item.get('test_status', 'pending'),
+        'upload_batch': item.get('upload_batch'),
+        'notes': item.get('notes'),
+        'metadata': item.get('metadata', {})
+    }
+
+def prepare_folder(folder_path: str, folder_name: str) -> Dict[str, Any]:
+    """Read, parse and validate a folder's files without touching the network
     
-    try:
-        # Validate folder access
-        if not os.path.exists(folder_path):
-            raise UploadError(f"Folder not found: {folder_path}")
-        
-        if not os.access(folder_path, os.R_OK):
-            raise UploadError(f"No read permission for folder: {folder_path}")
-        
-        # Get files (exclude result files from previous runs)
-        excluded_json_files = {'upload_success.json', 'upload_failed.json'}
+    Problems with the JSON file are returned in json_error rather than raised, so the
+    folder still gets its images uploaded and a result file written.
+    """
+    # Validate folder access
+    if not os.path.exists(folder_path):
+        raise UploadError(f"Folder not found: {folder_path}")
+    
+    if not os.access(folder_path, os.R_OK):
+        raise UploadError(f"No read permission for folder: {folder_path}")
+    
+    # Classify files in one pass (result files from previous runs are kept separate)
+    json_files, image_files, result_files = classify_folder(folder_path)
+    
+    json_data = None
+    json_error = None
+    db_records = []
+    
+    if len(json_files) == 0:
+        json_error = "No JSON files found in folder"
+    elif len(json_files) > 1:
+        json_error = f"Multiple JSON files found: {json_files}. Expected only one."
+    else:
+        json_filename = json_files[0]
+        file_path = os.path.join(folder_path, json_filename)
         
         try:
-            all_files = os.listdir(folder_path)
-        except OSError as e:
-            raise UploadError(f"Cannot read folder contents: {e}")
+            # Validate file access
+            if not os.access(file_path, os.R_OK):
+                raise ValidationError(f"No read permission for JSON file: {json_filename}")
+            
+            if os.path.getsize(file_path) == 0:
+                raise ValidationError(f"JSON file is empty: {json_filename}")
+            
+            # Read and parse JSON
+            json_data = load_json_file(file_path)
+            
+            # Validate JSON structure
+            validate_json_structure(json_data, json_filename)
+            
+            # A single object is one record, an array holds one record per object
+            items = [json_data] if isinstance(json_data, dict) else json_data
+            db_records = [_to_db_record(item, folder_name) for item in items if isinstance(item, dict)]
+            
+            if not db_records:
+                json_error = "No valid records found in JSON"
+                
+        except json.JSONDecodeError as e:
+            json_error = f"Error decoding JSON from {json_filename}: {e}"
+        except ValidationError as e:
+            json_error = str(e)
+        except Exception as e:
+            json_error = f"Error processing {json_filename}: {e}"
+    
+    return {
+        "json_files": json_files,
+        "image_files": image_files,
+        "result_files": result_files,
+        "json_data": json_data,
+        "json_error": json_error,
+        "db_records": db_records
+    }
+
+def process_single_folder(table: SyncRequestBuilder, bucket: Any,
+                         storage_session: httpx.AsyncClient, folder_path: str,
+                         folder_name: str, table_name: str,
+                         max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                         existing_rows: int = 0, public_url_base: Optional[str] = None,
+                         record_writer: Optional[BatchWriter] = None,
+                         image_writer: Optional[BatchWriter] = None,
+                         prepared: Optional[Dict[str, Any]] = None) -> bool:
+    """Process a single folder with comprehensive error handling
+    
+    existing_rows is the number of the folder's rows already in the table. When it matches
+    the JSON the insert is skipped and only the images are uploaded and linked; any other
+    count is a partial earlier insert, which is finished with an upsert. Folders with
+    fewer than INSERT_CHUNK_SIZE records are inserted through record_writer when given,
+    and image URLs are linked through image_writer when given. prepared is the
+    folder's prepare_folder result, read here when not supplied.
+    """
+    logger.info(f"\n📁 Processing folder: {folder_name}")
+    
+    try:
+        # Folders are normally read and parsed ahead of time by the pipeline producer
+        if prepared is None:
+            prepared = prepare_folder(folder_path, folder_name)
         
-        json_files = [f for f in all_files 
-                      if f.endswith('.json') and f not in excluded_json_files]
-        image_files = get_image_files(folder_path)
+        json_files = prepared["json_files"]
+        image_files = prepared["image_files"]
+        json_data = prepared["json_data"]
+        json_error = prepared["json_error"]
+        db_records = prepared["db_records"]
         
         logger.info(f"    Found {len(json_files)} JSON file(s) and {len(image_files)} image(s)")
         
+        # Start image uploads on the event loop so they overlap with the JSON insert;
+        # a previous failed or partial run means some images may already be in the bucket
+        resume = existing_rows > 0 or 'upload_failed.json' in prepared["result_files"]
+        images_future = run_async(upload_images_to_bucket(
+            bucket, storage_session, folder_path, folder_name, image_files,
+            max_concurrency=max_connections, public_url_base=public_url_base, resume=resume
+        ))
+        
         # Metadata for result files
         timestamp = datetime.now().isoformat()
         metadata = {
@@ -408,120 +1019,68 @@ def process_single_folder(supabase: Client, folder_path: str, folder_name: str,
             "folder_name": folder_name,
             "folder_path": folder_path,
             "table_name": table_name,
-            "bucket_name": "devicetest"
+            "bucket_name": bucket.id
         }
         
-        # Process JSON file
+        # Insert the JSON records
         json_upload_success = False
-        json_data = None
-        json_error = None
         records_inserted = 0
         
-        if len(json_files) == 0:
-            json_error = "No JSON files found in folder"
-            logger.warning(f"    ⚠️  {json_error}")
-        elif len(json_files) > 1:
-            json_error = f"Multiple JSON files found: {json_files}. Expected only one."
-            logger.error(f"    ✗ {json_error}")
+        if json_error:
+            if json_files:
+                logger.error(f"    ✗ {json_error}")
+            else:
+                logger.warning(f"    ⚠️  {json_error}")
+        elif existing_rows == len(db_records):
+            logger.info(f"    ⏭️  Rows for {folder_name} already exist in {table_name} - skipping insert")
+            json_upload_success = True
         else:
             json_filename = json_files[0]
-            file_path = os.path.join(folder_path, json_filename)
             
             try:
-                # Validate file access
-                if not os.access(file_path, os.R_OK):
-                    raise ValidationError(f"No read permission for JSON file: {json_filename}")
-                
-                if os.path.getsize(file_path) == 0:
-                    raise ValidationError(f"JSON file is empty: {json_filename}")
-                
-                # Read and parse JSON
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                
-                # Validate JSON structure
-                validate_json_structure(json_data, json_filename)
-                
-                # Prepare data for database insertion
-                db_records = []
-                
-                if isinstance(json_data, dict):
-                    # Single record
-                    db_record = {
-                        'folder_name': folder_name,
-                        'data_type': json_data.get('data_type', 'device_test'),
-                        'data': json_data,
-                        'device_id': json_data.get('device_id'),
-                        'device_name': json_data.get('device_name'),
-                        'device_type': json_data.get('device_type'),
-                        'test_results': json_data.get('test_results'),
-                        'test_date': json_data.get('test_date'),
-                        'test_status': json_data.get('test_status', 'pending'),
-                        'upload_batch': json_data.get('upload_batch'),
-                        'notes': json_data.get('notes'),
-                        'metadata': json_data.get('metadata', {})
-                    }
-                    db_records.append(db_record)
-                    
-                elif isinstance(json_data, list):
-                    # Multiple records
-                    for item in json_data:
-                        if isinstance(item, dict):
-                            db_record = {
-                                'folder_name': folder_name,
-                                'data_type': item.get('data_type', 'device_test'),
-                                'data': item,
-                                'device_id': item.get('device_id'),
-                                'device_name': item.get('device_name'),
-                                'device_type': item.get('device_type'),
-                                'test_results': item.get('test_results'),
-                                'test_date': item.get('test_date'),
-                                'test_status': item.get('test_status', 'pending'),
-                                'upload_batch': item.get('upload_batch'),
-                                'notes': item.get('notes'),
-                                'metadata': item.get('metadata', {})
-                            }
-                            db_records.append(db_record)
-                
-                if db_records:
+                if existing_rows:
+                    # An earlier run inserted only part of the folder (e.g. some insert chunks
+                    # failed); upsert so the rows already there are updated, not duplicated
+                    logger.warning(f"    ⚠️  {existing_rows} row(s) for {folder_name} already exist but the JSON has "
+                                   f"{len(db_records)} - upserting the rest")
                     success, error_msg, records_inserted = insert_data_with_retry(
-                        supabase, table_name, db_records
+                        table, db_records, upsert=True
                     )
-                    
-                    if success:
-                        logger.info(f"    ✓ Inserted {records_inserted} row(s) from {json_filename}")
-                        json_upload_success = True
-                    else:
-                        json_error = f"Database insert failed: {error_msg}"
-                        logger.error(f"    ✗ {json_error}")
+                elif record_writer is not None and len(db_records) < INSERT_CHUNK_SIZE:
+                    # Share one insert request with the other folders in flight
+                    success, error_msg, records_inserted = record_writer.submit(db_records).result()
                 else:
-                    json_error = "No valid records found in JSON"
+                    success, error_msg, records_inserted = insert_data_with_retry(
+                        table, db_records
+                    )
+                
+                if success:
+                    logger.info(f"    ✓ Inserted {records_inserted} row(s) from {json_filename}")
+                    json_upload_success = True
+                else:
+                    json_error = f"Database insert failed: {error_msg}"
                     logger.error(f"    ✗ {json_error}")
                     
-            except json.JSONDecodeError as e:
-                json_error = f"Error decoding JSON from {json_filename}: {e}"
-                logger.error(f"    ✗ {json_error}")
-            except ValidationError as e:
-                json_error = str(e)
-                logger.error(f"    ✗ {json_error}")
             except Exception as e:
                 json_error = f"Error processing {json_filename}: {e}"
                 logger.error(f"    ✗ {json_error}")
         
-        # Upload images
-        uploaded_images, failed_images, image_urls = upload_images_to_bucket(
-            supabase, folder_path, folder_name, image_files
-        )
+        # Wait for the image uploads to finish
+        uploaded_images, failed_images, image_urls = images_future.result()
         
         # Update database records with image URLs if both uploads were successful
         if json_upload_success and image_urls:
             try:
-                success, error_msg, updated_count = update_records_with_images(
-                    supabase, table_name, folder_name, image_urls
-                )
+                if image_writer is not None:
+                    # Share one bulk update with the other folders in flight
+                    success, error_msg, _ = image_writer.submit(
+                        [{'folder_name': folder_name, 'images': image_urls}]
+                    ).result()
+                else:
+                    success, error_msg, _ = update_records_with_images(table, folder_name, image_urls)
                 
                 if success:
-                    logger.info(f"    ✓ Updated {updated_count} record(s) with {len(image_urls)} image URLs")
+                    logger.info(f"    ✓ Linked {len(image_urls)} image URLs to the folder's records")
                 else:
                     logger.warning(f"    ⚠️  Warning: Failed to update records with image URLs: {error_msg}")
                     
@@ -543,7 +1102,7 @@ def process_single_folder(supabase: Client, folder_path: str, folder_name: str,
                 "filename": json_files[0] if json_files else None,
                 "records_inserted": records_inserted,
                 "error": json_error,
-                "data_preview": str(json_data)[:200] + "..." if json_data and len(str(json_data)) > 200 else json_data
+                "data_preview": build_data_preview(json_data)
             },
             "image_upload": {
                 "total_images": len(image_files),
@@ -577,42 +1136,86 @@ def process_single_folder(supabase: Client, folder_path: str, folder_name: str,
     except UploadError as e:
         error_msg = f"Upload error processing {folder_name}: {e}"
         logger.error(f"    💥 {error_msg}")
-        print(f"ERROR: {error_msg}")
         return False
     except Exception as e:
         error_msg = f"Unexpected error processing {folder_name}: {e}"
         logger.error(f"    💥 {error_msg}")
-        print(f"ERROR: {error_msg}")
         return False
 
-def update_records_with_images(supabase: Client, table_name: str, folder_name: str, 
+def update_records_with_images(table: SyncRequestBuilder, folder_name: str, 
                              image_urls: List[str], max_retries: int = 3) -> Tuple[bool, str, int]:
     """Update database records with image URLs"""
-    for attempt in range(max_retries):
-        try:
-            response = supabase.table(table_name).update({'images': image_urls}).eq('folder_name', folder_name).execute()
-            
-            if hasattr(response, 'data') and response.data:
-                return True, "", len(response.data)
-            else:
-                return False, "No records updated", 0
-                
-        except Exception as e:
-            error_msg = f"Update attempt {attempt + 1}/{max_retries} failed: {e}"
-            logger.warning(error_msg)
-            
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logger.info(f"Retrying update in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                return False, f"All update attempts failed. Last error: {e}", 0
+    try:
+        response = _with_retry(
+            lambda: table.update({'images': image_urls}).eq('folder_name', folder_name).execute(),
+            attempts=max_retries,
+            label="Update"
+        )
+    except Exception as e:
+        return False, f"All update attempts failed. Last error: {e}", 0
+    
+    if hasattr(response, 'data') and response.data:
+        return True, "", len(response.data)
+    
+    return False, "No records updated", 0
+
+def update_images_bulk(supabase: Client, updates: List[Dict],
+                       max_retries: int = 3) -> Tuple[bool, str, int]:
+    """Set the image URLs of several folders' records with one set_folder_images call"""
+    try:
+        response = _with_retry(
+            lambda: supabase.rpc('set_folder_images', {'updates': updates}).execute(),
+            attempts=max_retries,
+            label="Update"
+        )
+    except Exception as e:
+        return False, f"All update attempts failed. Last error: {e}", 0
+    
+    updated_count = response.data if isinstance(response.data, int) else 0
+    if updated_count:
+        return True, "", updated_count
+    
+    return False, "No records updated", 0
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Upload device test JSON data and images from subfolders to Supabase"
+    )
+    parser.add_argument(
+        "parent_folder",
+        nargs="?",
+        default="./sample",
+        help="Parent folder containing the subfolders to process (default: ./sample)"
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=os.getenv("IMG_CONCURRENCY", DEFAULT_MAX_CONNECTIONS),
+        help=f"Maximum number of parallel image uploads per folder (default: $IMG_CONCURRENCY or {DEFAULT_MAX_CONNECTIONS})"
+    )
+    
+    parser.add_argument(
+        "--folder-workers",
+        type=int,
+        default=os.getenv("UPLOAD_WORKERS", DEFAULT_FOLDER_WORKERS),
+        help=f"Maximum number of subfolders processed concurrently (default: $UPLOAD_WORKERS or {DEFAULT_FOLDER_WORKERS})"
+    )
+    
+    args = parser.parse_args(argv)
     
-    return False, "Max retries exceeded", 0
+    if args.max_connections < 1:
+        parser.error("--max-connections must be at least 1")
+    if args.folder_workers < 1:
+        parser.error("--folder-workers must be at least 1")
+    
+    return args
 
 def main():
     """Main function with comprehensive error handling"""
     try:
+        args = parse_arguments()
+        
         logger.info("🚀 Starting Supabase upload script")
         
         # Validate environment
@@ -624,7 +1227,6 @@ def main():
         
         if not url or not key:
             error_msg = "Supabase URL and key must be provided"
-            print(f"ERROR: {error_msg}")
             raise UploadError(error_msg)
         
         # Initialize Supabase client with options
@@ -634,29 +1236,50 @@ def main():
                 persist_session=True
             )
             supabase: Client = create_client(url, key, options)
+            
+            # Bucket listings for resumed folders go through an async client on the background event loop
+            async_supabase: AsyncClient = run_async(acreate_client(
+                url, key, AsyncClientOptions(auto_refresh_token=True, persist_session=True)
+            )).result()
             logger.info("✓ Supabase client initialized")
         except Exception as e:
             error_msg = f"Failed to initialize Supabase client: {e}"
-            print(f"ERROR: {error_msg}")
             raise UploadError(error_msg)
         
+        # Size the keep-alive pool for every concurrent folder insert
+        try:
+            configure_connection_pool(supabase, args.folder_workers * INSERT_WORKERS)
+        except Exception as e:
+            logger.warning(f"Could not configure HTTP connection pool, using client defaults: {e}")
+        
+        # Image uploads stream through a session of their own, sized for every concurrent upload
+        storage_session = create_storage_session(url, key, args.max_connections * args.folder_workers)
+        
         # Validate connection
         if not validate_supabase_connection(supabase):
             error_msg = "Cannot establish connection to Supabase"
-            print(f"ERROR: {error_msg}")
             raise UploadError(error_msg)
         
         # Configuration
-        parent_folder = "./sample"
-        table_name = "device_test"
+        parent_folder = args.parent_folder.strip()
+        table_name = TABLE_NAME
+        max_connections = args.max_connections
+        folder_workers = args.folder_workers
         
-        # Allow command line argument for parent folder
-        if len(sys.argv) > 1:
-            parent_folder = sys.argv[1].strip()
-            if not parent_folder:
-                error_msg = "Parent folder path cannot be empty"
-                print(f"ERROR: {error_msg}")
-                raise UploadError(error_msg)
+        # Build the table and bucket request builders once and share them across all folders
+        table = supabase.table(table_name)
+        bucket = async_supabase.storage.from_(BUCKET_NAME)
+        
+        # Public URLs are deterministic, so build them locally rather than per image through the SDK
+        public_url_base = f"{url}/storage/v1/object/public/{bucket.id}"
+        
+        # The connection check above already opened a REST connection; open a storage
+        # connection in the background while the folders are scanned
+        run_async(warm_up_storage(storage_session, bucket.id))
+        
+        if not parent_folder:
+            error_msg = "Parent folder path cannot be empty"
+            raise UploadError(error_msg)
         
         # Validate parent folder
         parent_folder = os.path.abspath(parent_folder)
@@ -664,7 +1287,9 @@ def main():
         logger.info(f"📋 Configuration:")
         logger.info(f"    Parent folder: '{parent_folder}'")
         logger.info(f"    Target table: {table_name}")
-        logger.info(f"    Target bucket: devicetest")
+        logger.info(f"    Target bucket: {bucket.id}")
+        logger.info(f"    Max connections per folder: {max_connections}")
+        logger.info(f"    Concurrent folders: {folder_workers}")
         
         # Get subfolders to process
         try:
@@ -672,38 +1297,115 @@ def main():
         except UploadError as e:
             error_msg = f"Error getting subfolders: {e}"
             logger.error(error_msg)
-            print(f"ERROR: {error_msg}")
             return 1
         
         if not folders_to_process:
             logger.info("No subfolders found to process!")
             return 0
         
+        # Count the rows earlier runs inserted for each folder so they are not inserted twice
+        try:
+            existing_counts = get_existing_row_counts(
+                supabase, table, [folder_name for _, folder_name in folders_to_process]
+            )
+        except Exception as e:
+            logger.warning(f"Could not look up existing rows, inserting all folders: {e}")
+            existing_counts = {}
+        
+        if existing_counts:
+            logger.info(f"{len(existing_counts)} folder(s) already have rows in {table_name} - complete ones skip their JSON insert")
+        
+        # Small folders' rows are combined into shared insert requests
+        record_writer = BatchWriter(lambda rows: _insert_chunk_with_retry(table, rows))
+        
+        # Image URLs of folders finishing together are linked with one bulk update; without
+        # set_folder_images in the database each folder's records are updated on their own
+        image_writer = BatchWriter(lambda updates: update_images_bulk(supabase, updates))
+        try:
+            supabase.rpc('set_folder_images', {'updates': []}).execute()
+        except Exception as e:
+            if getattr(e, 'code', None) == 'PGRST202':
+                logger.warning("set_folder_images is not in the database (run migration.sql) - linking images per folder")
+                image_writer = None
+            else:
+                logger.debug(f"set_folder_images check failed: {e}")
+        
         # Counters for summary
         total_folders_processed = 0
         successful_folders = 0
         failed_folders = 0
         
-        # Process each subfolder
-        for folder_path, folder_name in folders_to_process:
-            total_folders_processed += 1
+        # A producer thread reads and parses folders a few ahead of the upload workers, so
+        # local file work overlaps the network calls; each folder resolves its own future
+        futures: Dict[Future, Tuple[str, str]] = {
+            Future(): folder for folder in folders_to_process
+        }
+        prepared_queue: queue.Queue = queue.Queue(maxsize=PREPARE_AHEAD * folder_workers)
+        stop_event = threading.Event()
+        
+        def produce() -> None:
+            try:
+                for future, (folder_path, folder_name) in futures.items():
+                    if stop_event.is_set():
+                        break
+                    try:
+                        prepared = prepare_folder(folder_path, folder_name)
+                    except Exception:
+                        # process_single_folder repeats the checks and reports the error
+                        prepared = None
+                    prepared_queue.put((future, folder_path, folder_name, prepared))
+            finally:
+                for _ in range(folder_workers):
+                    prepared_queue.put(None)
+        
+        def consume() -> None:
+            while True:
+                item = prepared_queue.get()
+                if item is None:
+                    return
+                future, folder_path, folder_name, prepared = item
+                if stop_event.is_set() or not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(process_single_folder(
+                        table, bucket, storage_session, folder_path, folder_name, table_name,
+                        max_connections=max_connections,
+                        existing_rows=existing_counts.get(folder_name, 0),
+                        public_url_base=public_url_base,
+                        record_writer=record_writer,
+                        image_writer=image_writer,
+                        prepared=prepared
+                    ))
+                except Exception as e:
+                    future.set_exception(e)
+        
+        threading.Thread(target=produce, name="folder-prepare", daemon=True).start()
+        
+        with ThreadPoolExecutor(max_workers=folder_workers, thread_name_prefix="folder") as executor:
+            for _ in range(folder_workers):
+                executor.submit(consume)
             
             try:
-                success = process_single_folder(supabase, folder_path, folder_name, table_name)
-                if success:
-                    successful_folders += 1
-                else:
-                    failed_folders += 1
+                for future in as_completed(futures):
+                    folder_name = futures[future][1]
+                    total_folders_processed += 1
                     
+                    try:
+                        if future.result():
+                            successful_folders += 1
+                        else:
+                            failed_folders += 1
+                            
+                    except Exception as e:
+                        error_msg = f"Unexpected error processing {folder_name}: {e}"
+                        logger.error(f"💥 {error_msg}")
+                        failed_folders += 1
+                        
             except KeyboardInterrupt:
-                logger.warning("Process interrupted by user")
-                break
-            except Exception as e:
-                error_msg = f"Unexpected error processing {folder_name}: {e}"
-                logger.error(f"💥 {error_msg}")
-                print(f"ERROR: {error_msg}")
-                failed_folders += 1
-                continue
+                logger.warning("Process interrupted by user - cancelling pending folders")
+                stop_event.set()
+                for future in futures:
+                    future.cancel()
         
         # Final summary
         logger.info(f"\n" + "="*50)
@@ -729,17 +1431,14 @@ def main():
     except UploadError as e:
         error_msg = f"Upload error: {e}"
         logger.error(error_msg)
-        print(f"ERROR: {error_msg}")
         return 1
     except KeyboardInterrupt:
         interrupt_msg = "Script interrupted by user"
         logger.warning(interrupt_msg)
-        print(f"WARNING: {interrupt_msg}")
         return 1
     except Exception as e:
         error_msg = f"Unexpected error in main: {e}"
         logger.error(error_msg)
-        print(f"ERROR: {error_msg}")
         return 1
 
 if __name__ == "__main__":